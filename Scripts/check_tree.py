@@ -1,17 +1,61 @@
 import os
-import re
+from collections import deque
+from types import MappingProxyType
+
+# 行首的缩进符号，例如: "|   |   |-" 等，若与你的实际格式不符，请相应调整
+# 空白部分与正则 \s 匹配的 Unicode 空白字符（即 str.isspace() 为真的字符）完全一致
+_INDENT_CHARS = (
+    "|-"
+    "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680"
+    "\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a"
+    "\u2028\u2029\u202f\u205f\u3000"
+)
+# 名称前可能残留的 "-"、"——"
+_DASH_CHARS = "-—"
+
+# 所有叶子节点共享的只读空 children，首次添加子节点时才分配真正的 dict
+_NO_CHILDREN = MappingProxyType({})
 
 class TreeNode:
     """
     用于表示树结构的节点。
     name: 节点名称
-    children: {子节点名称: TreeNode对象}
+    children: {子节点名称: TreeNode对象}，叶子节点为共享的只读空映射
+    sig: 整棵子树（名称结构）的签名，由 compute_signatures 计算；签名相同的两棵子树视为一致
     """
+    __slots__ = ("name", "children", "sig")
+
     def __init__(self, name):
         self.name = name
-        self.children = {}
+        self.children = _NO_CHILDREN
+        self.sig = None
+
+    def add_child(self, node):
+        """添加子节点，必要时才为当前节点分配 children 字典"""
+        if self.children is _NO_CHILDREN:
+            self.children = {}
+        self.children[node.name] = node
+
+def compute_signatures(root: TreeNode):
+    """
+    自底向上为 root 下的每个节点计算子树签名。
+    叶子节点取名称的哈希；目录取 (名称, 子节点签名集合) 的哈希，与子节点顺序无关。
+    """
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(node.children.values())
+    # 先序遍历的逆序保证子节点总是先于父节点计算
+    for node in reversed(order):
+        children = node.children
+        if children:
+            node.sig = hash((node.name, frozenset(child.sig for child in children.values())))
+        else:
+            node.sig = hash(node.name)
 
-def parse_tree_file(filepath):
+def parse_tree_file(filepath, name_index: dict | None = None):
     """
     从目录树文件中解析出树结构，返回一个虚拟根节点 (TreeNode)。
     目录树文件格式假设类似：
@@ -23,130 +67,179 @@ def parse_tree_file(filepath):
 
     注意：如果文件格式与示例中不完全一致，需要根据实际情况修改解析逻辑。
 
-    这里我们显式使用 encoding='utf-16' 打开文件。
-    如果你的文件是 UTF-16-LE 或 BE，可以改用 'utf-16-le' 或 'utf-16-be'。
+    文件按 UTF-16 解码：根据 BOM 判断字节序，没有 BOM 时默认按 UTF-16-LE 处理。
+
+    若传入 name_index，则在解析过程中顺便记录 {名称: 第一个同名节点}，
+    供 find_node_by_name 直接查找，无需再遍历整棵树。
     """
     root = TreeNode("虚拟根")  # 用来挂载所有第一层节点
     stack = [(root, -1)]       # (TreeNode, depth)
+    if name_index is not None:
+        name_index.setdefault(root.name, root)
+
+    # 一次性读取整个文件并整体解码，避免逐行经过增量解码器
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if raw.startswith(b'\xfe\xff'):
+        text = raw[2:].decode('utf-16-be')
+    else:
+        if raw.startswith(b'\xff\xfe'):
+            raw = raw[2:]
+        text = raw.decode('utf-16-le')
 
-    # 用于匹配行首的缩进符号，例如: "|   |   |-" 等
-    # 这里用一个简单的正则，若与你的实际格式不符，请相应调整
-    # pattern = re.compile(r"^(?P<indent>[\|\s\-]+)(?P<name>.+)$")
-    pattern = re.compile(r"^(?P<indent>[|\s\-]+)(?P<name>.+)$")
+    # 与文本模式读取一致，只把 \r\n、\r、\n 当作换行；str.splitlines 还会在 \x0c、\x85、U+2028 等字符处断行
+    for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        line = line.rstrip()
+        if not line:
+            continue
 
-    with open(filepath, 'r', encoding='utf-16') as f:
-        for line in f:
-            line = line.rstrip('\n').rstrip()
-            if not line:
-                continue
+        # 如果该行有像 "|——"、"|- " 的格式
+        # 用 C 层实现的 lstrip/count 一次切分出缩进与名称，不再逐行执行正则
+        rest = line.lstrip(_INDENT_CHARS)
+        if not rest:
+            # 整行都是缩进符号（如 "|   |"）时，与原正则 ^([|\s\-]+)(.+)$ 一样把最后一个字符留作名称
+            rest = line[-1:]
+        indent_len = len(line) - len(rest)
+        if indent_len:
+            # 去掉前面可能的 "-"、"——"、空格等
+            name_str = rest.lstrip(_DASH_CHARS).lstrip()
+
+            # 计算层级，简单地根据行首缩进符中 '|' 的数量来计算
+            depth = line.count('|', 0, indent_len)
 
-            # 如果该行有像 "|——"、"|- " 的格式
-            match = pattern.match(line)
-            if match:
-                indent_str = match.group("indent")  # 行首缩进符
-                name_str = match.group("name")      # 实际名称
-
-                # 计算层级，简单地根据 '|' 的数量来计算
-                depth = indent_str.count('|')
-
-                # 去掉前面可能的 "-"、"——"、空格等
-                name_str = re.sub(r"^[\-—]+", "", name_str).strip()
-
-                # 创建一个节点
-                node = TreeNode(name_str)
-
-                # 通过与栈顶对比层级，找到父节点
-                while stack and stack[-1][1] >= depth:
-                    stack.pop()
-
-                if stack:
-                    parent_node, _ = stack[-1]
-                    parent_node.children[name_str] = node
-                    stack.append((node, depth))
-            else:
-                # 若不匹配，可能是第一层（无缩进），直接处理
-                # 假设没有 "| " 符号、只有纯文字时处理
-                line_clean = line.lstrip("|\- ").strip()
-                if line_clean:
-                    # 默认当作深度=0
-                    node = TreeNode(line_clean)
-                    # 将该节点挂到根下面
-                    root.children[line_clean] = node
-                    stack = [(root, -1), (node, 0)]
+            # 创建一个节点
+            node = TreeNode(name_str)
 
+            # 通过与栈顶对比层级，找到父节点
+            while stack and stack[-1][1] >= depth:
+                stack.pop()
+
+            if stack:
+                parent_node, _ = stack[-1]
+                parent_node.add_child(node)
+                stack.append((node, depth))
+                if name_index is not None:
+                    name_index.setdefault(name_str, node)
+        else:
+            # 若不匹配，可能是第一层（无缩进），直接处理
+            # 假设没有 "| " 符号、只有纯文字时处理
+            line_clean = line.lstrip("|\- ").strip()
+            if line_clean:
+                # 默认当作深度=0
+                node = TreeNode(line_clean)
+                # 将该节点挂到根下面
+                root.add_child(node)
+                stack = [(root, -1), (node, 0)]
+                if name_index is not None:
+                    name_index.setdefault(line_clean, node)
+
+    compute_signatures(root)
     return root
 
-def find_node_by_name(root: TreeNode, target_name: str) -> TreeNode | None:
+def find_node_by_name(root: TreeNode, target_name: str, name_index: dict | None = None) -> TreeNode | None:
     """
-    在整棵树root下，递归搜索名称为 target_name 的节点。
+    在整棵树root下，按先序遍历搜索名称为 target_name 的节点。
     找到则返回该节点，否则返回 None。
+    若提供了 parse_tree_file 生成的 name_index，则直接 O(1) 查找。
     """
-    if root.name == target_name:
-        return root
-    for child in root.children.values():
-        result = find_node_by_name(child, target_name)
-        if result:
-            return result
+    if name_index is not None:
+        return name_index.get(target_name)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.name == target_name:
+            return node
+        # 逆序入栈，保证与递归先序遍历的查找顺序一致
+        stack.extend(reversed(node.children.values()))
     return None
 
 def build_local_tree(path):
     """
-    从本地文件夹 path 出发，递归构建 TreeNode 形式的树结构，并返回根节点。
+    从本地文件夹 path 出发，迭代构建 TreeNode 形式的树结构，并返回根节点。
     根节点名称采用 path 的最后一级目录名。
+    使用显式栈代替递归，并直接复用 DirEntry 中缓存的类型信息，避免额外的 stat 调用。
     """
     root_name = os.path.basename(path.rstrip("\\/"))
     root_node = TreeNode(root_name)
 
-    try:
-        for entry in os.scandir(path):
-            if entry.is_dir():
-                sub_node = build_local_tree(entry.path)
-                root_node.children[sub_node.name] = sub_node
-            else:
-                file_node = TreeNode(entry.name)
-                root_node.children[file_node.name] = file_node
-    except PermissionError:
-        # 若没有权限访问，可根据需要处理
-        pass
+    stack = [(root_node, path)]
+    while stack:
+        parent_node, dir_path = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    node = TreeNode(entry.name)
+                    parent_node.add_child(node)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((node, entry.path))
+        except PermissionError:
+            # 若没有权限访问，可根据需要处理
+            pass
 
+    compute_signatures(root_node)
     return root_node
 
-def compare_trees(node_tree: TreeNode, node_local: TreeNode, diff_log: list, path=""):
+def compare_trees(node_tree: TreeNode, node_local: TreeNode, report, path="") -> int:
     """
     比对两棵树（node_tree vs node_local），只比较名称。
     node_tree: 目录树文件中的 TreeNode
     node_local: 本地文件夹构建的 TreeNode
-    diff_log: 用于存储差异信息的列表
+    report: 每发现一条差异就调用一次的回调，例如 print 或 diff_log.append
     path: 当前比对层级在日志中的前缀 (相对路径)，用于更清晰的输出
+    返回发现的差异数量。
+
+    使用显式栈代替递归，输出顺序与逐层深度优先比对一致。
+    差异逐条交给 report 处理，不在内存中累积。
     """
-    # 取出子节点名称集合
-    tree_children_names = set(node_tree.children.keys())
-    local_children_names = set(node_local.children.keys())
-
-    # 目录树文件多出的项
-    only_in_tree = tree_children_names - local_children_names
-    # 本地多出的项
-    only_in_local = local_children_names - tree_children_names
-    # 两边都有的项
-    both = tree_children_names & local_children_names
-
-    if only_in_tree:
-        for name in sorted(only_in_tree):
-            diff_log.append(f"[目录树文件多出] {path}/{name}")
-
-    if only_in_local:
-        for name in sorted(only_in_local):
-            diff_log.append(f"[本地多出] {path}/{name}")
-
-    # 递归比对两边都存在的节点
-    for name in sorted(both):
-        child_tree = node_tree.children[name]
-        child_local = node_local.children[name]
+    diff_count = 0
+    stack = deque([(node_tree, node_local, path)])
+    while stack:
+        cur_tree, cur_local, cur_path = stack.pop()
+        tree_children = cur_tree.children
+        local_children = cur_local.children
+
+        if tree_children.keys() == local_children.keys():
+            # 常见情况：两边名称完全一致，直接在 C 层比较 keys 视图，无需逐项分类
+            only_in_tree = only_in_local = ()
+            both = tree_children
+        else:
+            # 一次遍历区分 目录树文件多出的项 与 两边都有的项
+            only_in_tree = []
+            both = []
+            for name in tree_children:
+                if name in local_children:
+                    both.append(name)
+                else:
+                    only_in_tree.append(name)
+            # 本地多出的项
+            only_in_local = [name for name in local_children if name not in tree_children]
+
+        if only_in_tree:
+            diff_count += len(only_in_tree)
+            for name in sorted(only_in_tree):
+                report(f"[目录树文件多出] {cur_path}/{name}")
+
+        if only_in_local:
+            diff_count += len(only_in_local)
+            for name in sorted(only_in_local):
+                report(f"[本地多出] {cur_path}/{name}")
 
         # 若任意一方没有子节点，则视为文件，或者也可以根据需要更精细的判断
-        # 如果都还有 children（或不为空），才递归下去
-        if child_tree.children or child_local.children:
-            compare_trees(child_tree, child_local, diff_log, path + "/" + name)
+        # 如果都还有 children（或不为空），才继续比对下去；子树签名一致时无需再比对
+        pending = []
+        for name in both:
+            child_tree = tree_children[name]
+            child_local = local_children[name]
+            if not (child_tree.children or child_local.children):
+                continue
+            if child_tree.sig is not None and child_tree.sig == child_local.sig:
+                continue
+            pending.append(name)
+        # 逆序入栈，保证按名称顺序依次比对
+        for name in sorted(pending, reverse=True):
+            stack.append((tree_children[name], local_children[name], cur_path + "/" + name))
+
+    return diff_count
 
 def main(tree_file_path,local_file_path):
     """
@@ -154,10 +247,11 @@ def main(tree_file_path,local_file_path):
     """
 
     # 1) 解析目录树文件 (UTF-16)
-    full_tree = parse_tree_file(tree_file_path)
+    name_index = {}
+    full_tree = parse_tree_file(tree_file_path, name_index)
 
     # 2) 在解析后的树中，找到要对比的节点 (例如 "media")
-    media_node = find_node_by_name(full_tree, "media")
+    media_node = find_node_by_name(full_tree, "media", name_index)
     if not media_node:
         print("在目录树文件中未找到 'media' 节点，无法进行比对。")
         return
@@ -165,19 +259,23 @@ def main(tree_file_path,local_file_path):
     # 3) 构建本地目录的树结构
     local_root = build_local_tree(local_file_path)
 
-    # 4) 比对
-    diff_log = []
+    # 4) 比对，并在发现差异时直接输出
+    header_printed = False
+
+    def report(line):
+        nonlocal header_printed
+        if not header_printed:
+            header_printed = True
+            print("发现差异如下：")
+        print(line)
+
     # path 参数初始可直接写"media"或其他自定义名称
     # 注意 local_root.name 也应该是 "media"
-    compare_trees(media_node, local_root, diff_log, path="media")
+    diff_count = compare_trees(media_node, local_root, report, path="media")
 
-    # 5) 输出差异结果
-    if not diff_log:
+    # 5) 没有差异时给出提示
+    if not diff_count:
         print("两边目录结构一致，没有发现差异。")
-    else:
-        print("发现差异如下：")
-        for line in diff_log:
-            print(line)
 
 if __name__ == "__main__":
     # 指定目录树文件(默认使用 UTF-16 编码) 和 本地文件夹路径
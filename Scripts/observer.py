@@ -0,0 +1,50 @@
+import os
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+# 原生监控（inotify 等）在这些网络文件系统上会丢失事件，auto 模式下改用轮询
+_NETWORK_FS_TYPES = {"cifs", "smb3", "smbfs", "nfs", "nfs4"}
+
+
+def _mount_fs_type(path):
+    """
+    从 /proc/mounts 中找出 path 所在挂载点的文件系统类型，无法判断时返回 None（例如非 Linux 平台）
+    """
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    real_path = os.path.realpath(path)
+    best_mount, best_type = "", None
+    for mount_point, fs_type in mounts:
+        # /proc/mounts 中的空格等字符以八进制转义
+        mount_point = mount_point.replace("\\040", " ")
+        if (real_path == mount_point or real_path.startswith(mount_point.rstrip("/") + "/")) \
+                and len(mount_point) > len(best_mount):
+            best_mount, best_type = mount_point, fs_type
+    return best_type
+
+
+def schedule_shared(observers, handler, path, observer_type="auto", poll_interval=30, event_filter=None):
+    """
+    将 handler 注册到与 path 监控方式相同的共享监控器上，返回该监控器。
+    每种监控方式只创建并启动一个监控器，所有映射共用它的事件分发线程，
+    因此 handler 的回调不应阻塞，耗时的文件操作需交给线程池或事件循环执行。
+    observers: {监控方式: 已启动的监控器}，由调用方保存，用于停止监控
+    event_filter: handler 需要的事件类型列表，None 表示全部。
+                  原生监控（inotify）据此只向内核订阅对应的事件，媒体服务器读取文件产生的打开、关闭等事件不再进入进程
+    observer_type:
+    native  使用系统原生的文件监控
+    polling 使用 PollingObserver，每 poll_interval 秒扫描一次目录
+    auto    path 位于 CIFS/SMB/NFS 等网络挂载上时使用轮询，否则使用原生监控
+    """
+    if observer_type == "auto":
+        observer_type = "polling" if _mount_fs_type(path) in _NETWORK_FS_TYPES else "native"
+    observer = observers.get(observer_type)
+    if observer is None:
+        observer = PollingObserver(timeout=poll_interval) if observer_type == "polling" else Observer()
+        observer.start()
+        observers[observer_type] = observer
+    observer.schedule(handler, path=path, recursive=True, event_filter=event_filter)
+    return observer
@@ -1,20 +1,221 @@
 import asyncio
-import functools
+import base64
+import json
 import os
 import logging
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import sys
+import threading
+import time
+from types import MappingProxyType
+from urllib.parse import urljoin
+import aiohttp
+from watchdog.events import (
+    DirCreatedEvent, DirDeletedEvent, DirModifiedEvent, DirMovedEvent,
+    FileClosedEvent, FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent, FileSystemEventHandler,
+)
 from alist import AList, AListUser
+from .observer import schedule_shared
+
+
+# 仅 Windows 的路径分隔符需要转换；POSIX 下原样返回，省去每次扫描字符串和分配新对象
+_POSIX = os.sep == "/"
+_TO_POSIX = str.maketrans("\\", "/")
+
+
+def _to_posix(path):
+    """将本地路径转换为使用正斜杠的形式"""
+    return path if _POSIX else path.translate(_TO_POSIX)
+
+
+def _remote_dirname(path):
+    """AList 路径的父目录：远程路径总是以 "/" 分隔，无需 os.path.dirname 的平台相关处理"""
+    return path.rpartition("/")[0] or "/"
+
+
+class PooledAList(AList):
+    """
+    复用同一个 aiohttp 连接池的 AList 客户端，并限制同时进行的请求数量。
+    SDK 默认每个请求都新建一个 ClientSession，这里重写 _request 以共享连接。
+    同时集中处理登录状态：Token 临近过期时主动重新登录，请求返回 401 时重新登录并重试一次，
+    并发的协程共享同一次登录。
+    """
+
+    LOGIN_PATH = "/api/auth/login/hash"
+    TOKEN_REFRESH_MARGIN = 60  # Token 剩余有效期少于该秒数时主动重新登录
+
+    def __init__(self, endpoint: str, max_concurrency: int = 8, proxy=None):
+        super().__init__(endpoint=endpoint, proxy=proxy)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+        self._user = None
+        self._token_expiry = None
+        self._login_lock = asyncio.Lock()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, proxy=self.proxy_url)
+        return self._session
+
+    async def _send(self, method, path, headers=None, **kwargs):
+        url = urljoin(self.endpoint, path)
+        if headers is None:
+            headers = self.headers
+        async with self._semaphore:
+            async with self._get_session().request(method, url, headers=headers, **kwargs) as response:
+                return await response.json()
+
+    async def _request(self, method, path, headers=None, **kwargs):
+        if path == self.LOGIN_PATH or self._user is None:
+            return await self._send(method, path, headers, **kwargs)
+        if self._token_expiry is not None and self._token_expiry - time.time() < self.TOKEN_REFRESH_MARGIN:
+            await self.relogin(self.token)
+        token = self.token
+        res = await self._send(method, path, headers, **kwargs)
+        if res.get("code") == 401:
+            await self.relogin(token)
+            res = await self._send(method, path, headers, **kwargs)
+        return res
+
+    async def login(self, user: AListUser, otp_code: str = "") -> bool:
+        success = await super().login(user, otp_code)
+        self._user = user
+        self._token_expiry = _jwt_expiry(self.token)
+        return success
+
+    async def relogin(self, stale_token):
+        """
+        重新登录。多个协程同时发现 Token 失效时只登录一次，其余协程等待并复用新的 Token。
+        """
+        async with self._login_lock:
+            if self.token != stale_token:
+                return
+            logging.warning("[ALIST] Token 已失效或即将过期，尝试重新登录。")
+            await self.login(self._user)
+            logging.info("[ALIST] 重新登录成功。")
+
+    async def close(self):
+        """关闭共享的连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+def _jwt_expiry(token):
+    """
+    解析 JWT Token 中的过期时间（exp，Unix 时间戳），无法解析时返回 None
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+# 所有叶子节点共享的只读空 children，首次添加子节点时才分配真正的 dict
+_NO_CHILDREN = MappingProxyType({})
+
+
+class _TrieNode:
+    __slots__ = ("children", "present")
+
+    def __init__(self):
+        self.children = _NO_CHILDREN
+        self.present = False
+
+
+class PathTrie:
+    """
+    按路径分段（以 "/" 分隔）存储相对路径的前缀树。
+    公共前缀只存储一次；删除一个路径时会连同其下的所有子路径一起移除。
+    """
+
+    def __init__(self, paths=()):
+        self._root = _TrieNode()
+        self.update(paths)
+
+    def _find(self, rel):
+        node = self._root
+        for part in rel.split("/"):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def add(self, rel):
+        node = self._root
+        for part in rel.split("/"):
+            child = node.children.get(part)
+            if child is None:
+                if node.children is _NO_CHILDREN:
+                    node.children = {}
+                # 媒体库中大量重复的名称（如 "Season 1"、"poster.jpg"）只保留一份字符串
+                child = node.children[sys.intern(part)] = _TrieNode()
+            node = child
+        node.present = True
+
+    def update(self, paths):
+        for rel in paths:
+            self.add(rel)
+
+    def discard(self, rel):
+        """移除路径及其整棵子树，路径不存在时不做任何操作"""
+        parent, _, name = rel.rpartition("/")
+        node = self._find(parent) if parent else self._root
+        if node is not None and name in node.children:
+            del node.children[name]
+
+    def __contains__(self, rel):
+        node = self._find(rel)
+        return node is not None and node.present
+
+    def __len__(self):
+        count = 0
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            count += node.present
+            stack.extend(node.children.values())
+        return count
+
+
+def _scandir_rel(base):
+    """
+    迭代遍历 base 目录，依次产出所有文件和文件夹相对于 base 的路径（使用正斜杠）。
+    相对路径在遍历过程中直接拼接生成，无需 relpath/join/replace。
+    """
+    stack = [(base, "")]
+    while stack:
+        abs_path, rel_prefix = stack.pop()
+        try:
+            with os.scandir(abs_path) as it:
+                for entry in it:
+                    rel = rel_prefix + entry.name
+                    yield rel
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, rel + "/"))
+        except OSError as e:
+            logging.warning(f"[ALIST] 无法遍历目录: {abs_path}, 错误: {e}")
 
 
 class AListSyncHandler(FileSystemEventHandler):
+    # 需要的事件类型；媒体服务器读取文件产生的打开、只读关闭事件不向 inotify 订阅
+    EVENT_FILTER = [
+        FileCreatedEvent, DirCreatedEvent,
+        FileModifiedEvent, DirModifiedEvent,
+        FileDeletedEvent, DirDeletedEvent,
+        FileMovedEvent, DirMovedEvent,
+        FileClosedEvent,
+    ]
+
     def __init__(
             self,
             alist: AList,
-            user: AListUser,  # 新增：接收 AListUser 对象
             remote_base_path: str,
             local_base_path: str,
             loop: asyncio.AbstractEventLoop,
+            event_queue: asyncio.Queue,  # 合并后的事件批次队列，由 SyncToAlist 统一消费
             source_base_directory: str,
             subtitle_extensions: set,  # 新增：字幕扩展名
             debounce_delay: float = 1.0,
@@ -23,115 +224,160 @@ class AListSyncHandler(FileSystemEventHandler):
     ):
         super().__init__()
         self.alist = alist
-        self.user = user  # 新增：存储用户对象
         self.remote_base_path = remote_base_path.rstrip('/')
         self.local_base_path = local_base_path.rstrip('/')
         self.loop = loop
+        self.event_queue = event_queue
         self.source_base_directory = source_base_directory.rstrip('/')
+        # 预先计算路径前缀，避免每个事件都调用 relpath 和拼接字符串
+        self._local_prefix = os.path.abspath(self.local_base_path).rstrip("\\/") + os.sep
+        self._local_prefix_len = len(self._local_prefix)
+        self._source_prefix = self.source_base_directory + "/"
+        self._remote_prefix = self.remote_base_path + "/"
         self.debounce_delay = debounce_delay  # 防抖延迟时间（秒）
         self.sync_delete = sync_delete  # 同步删除开关
         self.file_stable_time = file_stable_time  # 文件稳定时间（秒）
         self.subtitle_extensions = subtitle_extensions  # 设置字幕扩展名
-        self._tasks = {}  # 跟踪文件路径到任务的映射
-        self.existing_paths = set()  # 存储启动时已有的文件和文件夹的相对路径
-
+        self._subtitle_suffixes = tuple(ext.lower() for ext in subtitle_extensions)  # 供 str.endswith 一次性匹配
+        self._subtitle_suffix_len = max(map(len, self._subtitle_suffixes), default=0)  # 判断时只需转换末尾这几个字符的大小写
+        self._pending = {}  # 防抖窗口内暂存的事件: (事件类型, 源路径, 目标路径) -> 事件
+        self._pending_lock = threading.Lock()
+        self._flush_timer = None  # 当前防抖窗口的定时器
+        self._closed_sizes = {}  # 写入后已关闭的文件路径 -> (关闭时的文件大小, 关闭时间)
+        # 关闭记录只在随后的完整性检查中有用，超过该时间仍未被取用的记录视为过期
+        self._closed_size_ttl = debounce_delay + file_stable_time + 60
+        self._closed_sizes_pruned_at = time.monotonic()
+        self._close_waiters = {}  # 正在检查完整性的文件路径 -> asyncio.Event
+        self._pending_refreshes = {}  # 源目录 -> 尚未发出请求的刷新任务
+        # 存储启动时已有的文件和文件夹的相对路径
         # 初始化 existing_paths，遍历本地目录并记录所有现有文件和文件夹
-        for root, dirs, files in os.walk(self.local_base_path):
-            rel_root = os.path.relpath(root, self.local_base_path).replace("\\", "/")
-            if rel_root == ".":
-                rel_root = ""
-            for d in dirs:
-                path = os.path.join(rel_root, d).replace("\\", "/")
-                self.existing_paths.add(path)
-            for f in files:
-                path = os.path.join(rel_root, f).replace("\\", "/")
-                self.existing_paths.add(path)
+        self.existing_paths = PathTrie(_scandir_rel(self.local_base_path))
         logging.info(f"[ALIST] 已记录 {len(self.existing_paths)} 个现有路径，不会监控这些路径。")
 
     def should_ignore_file_creation_deletion(self, file_path):
         """
         判断文件是否是以 .mp 结尾的文件，若是则在创建和删除事件中忽略。
         """
-        return file_path.lower().endswith(".mp")
+        return file_path[-3:].lower() == ".mp"
 
     def is_subtitle_file(self, file_path):
         """
         判断文件是否为字幕文件。
         """
-        _, ext = os.path.splitext(file_path)
-        return ext.lower() in self.subtitle_extensions
+        if not self._subtitle_suffix_len:
+            return False
+        return file_path[-self._subtitle_suffix_len:].lower().endswith(self._subtitle_suffixes)
 
     def get_relative_path(self, src_path):
         """
         计算相对于本地监控基路径的相对路径
+        watchdog 给出的路径都位于基路径之下，直接截掉预先计算好的前缀即可
         """
-        return os.path.relpath(src_path, self.local_base_path).replace("\\", "/")  # 确保使用正斜杠
+        if src_path.startswith(self._local_prefix):
+            return _to_posix(src_path[self._local_prefix_len:])  # 确保使用正斜杠
+        return _to_posix(os.path.relpath(src_path, self.local_base_path))
 
     def get_remote_source_path(self, relative_path):
         """
         根据相对路径生成 AList 中的源路径
         """
-        return f"{self.source_base_directory}/{relative_path}"
+        return self._source_prefix + relative_path
 
     def get_remote_destination_path(self, relative_path):
         """
         根据相对路径生成 AList 中的目的路径
         """
-        return f"{self.remote_base_path}/{relative_path}"
+        return self._remote_prefix + relative_path
 
-    def schedule_task(self, coro, file_path):
+    async def is_file_complete(self, file_path):
         """
-        调度一个防抖任务，确保在指定延迟后执行
+        检查文件在指定时间内是否保持大小不变，以确定文件是否完整。
+        若收到该文件写入后关闭的通知（Linux 下的 IN_CLOSE_WRITE）且大小未再变化，则立即视为完整。
+        文件仍在增长时检查间隔逐步加倍（上限为稳定时间的一半），大小不再变化后直接等到稳定时间结束再确认。
+        文件变小（被截断后重新写入）时重新开始计时，检查间隔也恢复为最短间隔。
         """
-        if file_path in self._tasks:
-            task = self._tasks[file_path]
-            task.cancel()
-            logging.debug(f"[ALIST] 取消之前的任务: {file_path}")
-        future = asyncio.run_coroutine_threadsafe(self.debounce(coro, file_path), self.loop)
-        self._tasks[file_path] = future
-        logging.debug(f"[ALIST] 调度新任务: {file_path}")
+        logging.debug("[ALIST] 开始检查文件完整性: %s", file_path)
+        previous_size = -1
+        last_change = time.monotonic()
+        min_interval = 0.5  # 最短检查间隔（秒）
+        max_interval = max(min_interval, self.file_stable_time / 2)  # 最长检查间隔（秒）
+        check_interval = min_interval / 2
+        closed = self._close_waiters.setdefault(file_path, asyncio.Event())
+
+        try:
+            while True:
+                try:
+                    current_size = os.path.getsize(file_path)
+                except OSError:
+                    logging.warning(f"[ALIST] 文件不存在，无法检查完整性: {file_path}")
+                    return False
+                closed_size = self._closed_sizes.get(file_path)
+                if closed_size is not None and closed_size[0] == current_size:
+                    logging.debug("[ALIST] 文件已关闭写入，跳过稳定性等待: %s", file_path)
+                    return True
+                now = time.monotonic()
+                if current_size == previous_size:
+                    stable_time = now - last_change
+                    logging.debug("[ALIST] 文件大小未变化，稳定时间: %.1f/%s 秒", stable_time, self.file_stable_time)
+                    if stable_time >= self.file_stable_time:
+                        # logging.info(f"[ALIST] 文件已完成写入: {file_path}")
+                        return True
+                    wait_time = self.file_stable_time - stable_time
+                elif current_size < previous_size:
+                    # 文件被截断，之前的增长不再说明任何问题，从最短间隔重新开始检查
+                    logging.debug("[ALIST] 文件大小变小，从 %s 到 %s，重新开始检查", previous_size, current_size)
+                    previous_size = current_size
+                    last_change = now
+                    check_interval = min_interval
+                    wait_time = check_interval
+                else:
+                    logging.debug("[ALIST] 文件大小变化，从 %s 到 %s", previous_size, current_size)
+                    previous_size = current_size
+                    last_change = now
+                    check_interval = min(check_interval * 2, max_interval)
+                    wait_time = check_interval
+                # 等待下一次检查，期间若收到关闭通知则提前醒来
+                closed.clear()
+                try:
+                    await asyncio.wait_for(closed.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._close_waiters.pop(file_path, None)
+            self._closed_sizes.pop(file_path, None)
 
-    async def debounce(self, coro, file_path):
+    def mark_file_closed(self, file_path):
         """
-        等待防抖延迟后执行协程
+        记录文件写入后关闭时的大小，并唤醒正在检查该文件完整性的协程
         """
+        waiter = self._close_waiters.get(file_path)
+        if waiter is None and self.get_relative_path(file_path) in self.existing_paths:
+            # 已有文件的关闭事件不会触发完整性检查，无需记录
+            return
         try:
-            await asyncio.sleep(self.debounce_delay)
-            await coro
-        except asyncio.CancelledError:
-            logging.debug(f"[ALIST] 任务被取消: {file_path}")
-            pass
-        finally:
-            self._tasks.pop(file_path, None)
-            logging.debug(f"[ALIST] 任务完成或取消，移除任务: {file_path}")
+            size = os.path.getsize(file_path)
+        except OSError:
+            return
+        now = time.monotonic()
+        self._closed_sizes[file_path] = (size, now)
+        if waiter is not None:
+            waiter.set()
+        self.prune_closed_sizes(now)
 
-    async def is_file_complete(self, file_path):
+    def prune_closed_sizes(self, now):
         """
-        检查文件在指定时间内是否保持大小不变，以确定文件是否完整
+        清除过期的关闭记录。创建后未写入就关闭的文件（如 touch）不会产生修改事件，
+        其记录不会被完整性检查取走，若不清理会一直留在字典中
         """
-        logging.debug(f"[ALIST] 开始检查文件完整性: {file_path}")
-        previous_size = -1
-        stable_time = 0.0
-        check_interval = 1.0  # 检查间隔（秒）
-
-        while True:
-            if not os.path.exists(file_path):
-                logging.warning(f"[ALIST] 文件不存在，无法检查完整性: {file_path}")
-                return False
-            current_size = os.path.getsize(file_path)
-            if current_size == previous_size:
-                stable_time += check_interval
-                logging.debug(f"[ALIST] 文件大小未变化，稳定时间: {stable_time:.1f}/{self.file_stable_time} 秒")
-                if stable_time >= self.file_stable_time:
-                    # logging.info(f"[ALIST] 文件已完成写入: {file_path}")
-                    return True
-            else:
-                stable_time = 0.0
-                logging.debug(f"[ALIST] 文件大小变化，从 {previous_size} 到 {current_size}")
-                previous_size = current_size
-            await asyncio.sleep(check_interval)
+        if now - self._closed_sizes_pruned_at < self._closed_size_ttl:
+            return
+        self._closed_sizes_pruned_at = now
+        deadline = now - self._closed_size_ttl
+        for path in [path for path, (_, closed_at) in self._closed_sizes.items() if closed_at < deadline]:
+            if path not in self._close_waiters:
+                del self._closed_sizes[path]
 
-    async def handle_created_or_modified(self, event, retry=False):
+    async def handle_created_or_modified(self, event):
         """
         处理文件或文件夹的创建和修改事件
         """
@@ -142,7 +388,7 @@ class AListSyncHandler(FileSystemEventHandler):
 
         # 对于创建事件，忽略 .mp 文件
         if event.event_type == 'created' and self.should_ignore_file_creation_deletion(relative_path):
-            logging.debug(f"[ALIST] 忽略创建事件中的 .mp 文件: {relative_path}")
+            logging.debug("[ALIST] 忽略创建事件中的 .mp 文件: %s", relative_path)
             return
 
         # 仅在修改事件中且文件不在 existing_paths 时处理
@@ -152,6 +398,9 @@ class AListSyncHandler(FileSystemEventHandler):
                 await self.copy_subtitle_file(relative_path)
 
         # 仅在修改事件中且文件不在 existing_paths 时处理非字幕文件
+        if event.event_type != 'modified' or relative_path in self.existing_paths:
+            # 不会进行完整性检查，丢弃可能已记录的关闭信息
+            self._closed_sizes.pop(event.src_path, None)
         if event.event_type == 'modified' and relative_path not in self.existing_paths:
             self.existing_paths.add(relative_path)
             remote_source_path = self.get_remote_source_path(relative_path)
@@ -165,12 +414,7 @@ class AListSyncHandler(FileSystemEventHandler):
                     else:
                         logging.error(f"[ALIST] 文件夹创建失败或已存在: {remote_destination_path}")
                 except Exception as e:
-                    if not retry and 'token is expired' in str(e).lower():
-                        logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试 mkdir 操作。")
-                        await self.alist.login(self.user)
-                        await self.handle_created_or_modified(event, retry=True)
-                    else:
-                        logging.error(f"[ALIST] 创建文件夹失败: {remote_destination_path}, 错误: {e}")
+                    logging.error(f"[ALIST] 创建文件夹失败: {remote_destination_path}, 错误: {e}")
             else:
                 file_path = event.src_path
                 try:
@@ -179,14 +423,9 @@ class AListSyncHandler(FileSystemEventHandler):
                     else:
                         logging.error(f"[ALIST] 文件未完成写入，无法复制: {file_path}")
                 except Exception as e:
-                    if not retry and 'token is expired' in str(e).lower():
-                        logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试复制文件操作。")
-                        await self.alist.login(self.user)
-                        await self.handle_created_or_modified(event, retry=True)
-                    else:
-                        logging.error(f"[ALIST] 处理创建或修改事件时出错: {file_path}, 错误: {e}")
+                    logging.error(f"[ALIST] 处理创建或修改事件时出错: {file_path}, 错误: {e}")
 
-    async def copy_subtitle_file(self, relative_path, retry=False):
+    async def copy_subtitle_file(self, relative_path):
         """
         复制字幕文件到 AList
         在复制之前，先刷新源目录，确保 AList 检测到新增的文件
@@ -194,35 +433,24 @@ class AListSyncHandler(FileSystemEventHandler):
         remote_source_path = self.get_remote_source_path(relative_path)
         remote_destination_path = self.get_remote_destination_path(relative_path)
         try:
-            source_dir = os.path.dirname(remote_source_path)
-            async for _ in self.alist.list_dir(source_dir, refresh=True):
-                pass
+            source_dir = _remote_dirname(remote_source_path)
+            await self.refresh_source_dir(source_dir)
         except Exception as e:
-            if not retry and 'token is expired' in str(e).lower():
-                logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试刷新源路径目录。")
-                await self.alist.login(self.user)
-                await self.copy_subtitle_file(relative_path, retry=True)
-                return
             logging.error(f"[ALIST] 刷新 AList 中的源路径目录失败: {source_dir}, 错误: {e}")
             return
 
         # 执行复制操作
         try:
-            destination_dir = os.path.dirname(remote_destination_path)
+            destination_dir = _remote_dirname(remote_destination_path)
             success = await self.alist.copy(remote_source_path, destination_dir)
             if success:
                 logging.info(f"[ALIST] 字幕文件复制成功: {remote_source_path} -> {remote_destination_path}")
             else:
                 logging.error(f"[ALIST] 字幕文件复制失败: {remote_source_path} -> {remote_destination_path}")
         except Exception as e:
-            if not retry and 'token is expired' in str(e).lower():
-                logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试复制字幕文件操作。")
-                await self.alist.login(self.user)
-                await self.copy_subtitle_file(relative_path, retry=True)
-                return
             logging.error(f"[ALIST] 执行复制操作时出错: {remote_source_path} -> {remote_destination_path}, 错误: {e}")
 
-    async def handle_deleted(self, event, retry=False):
+    async def handle_deleted(self, event):
         """
         处理文件或文件夹的删除事件
         """
@@ -231,10 +459,10 @@ class AListSyncHandler(FileSystemEventHandler):
             logging.warning(f"[ALIST] 跳过相对路径为 '.' 或空字符串的删除事件: {event.src_path}")
             return
         if self.should_ignore_file_creation_deletion(relative_path):
-            logging.debug(f"[ALIST] 忽略删除事件中的 .mp 文件: {relative_path}")
+            logging.debug("[ALIST] 忽略删除事件中的 .mp 文件: %s", relative_path)
             return
         if relative_path not in self.existing_paths:
-            logging.debug(f"[ALIST] 删除事件的路径不在监控范围内，跳过: {relative_path}")
+            logging.debug("[ALIST] 删除事件的路径不在监控范围内，跳过: %s", relative_path)
             return
         if not self.sync_delete:
             logging.info(f"[ALIST] 同步删除功能关闭，忽略删除事件: {relative_path}")
@@ -255,29 +483,23 @@ class AListSyncHandler(FileSystemEventHandler):
                 else:
                     logging.error(f"[ALIST] 文件删除失败: {remote_destination_path}")
             self.existing_paths.discard(relative_path)
-            logging.debug(f"[ALIST] 从 existing_paths 中移除: {relative_path}")
+            logging.debug("[ALIST] 从 existing_paths 中移除: %s", relative_path)
         except Exception as e:
-            if not retry and 'token is expired' in str(e).lower():
-                logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试删除操作。")
-                await self.alist.login(self.user)
-                await self.handle_deleted(event, retry=True)
-            else:
-                logging.error(f"[ALIST] 处理删除事件时出错: {relative_path}, 错误: {e}")
+            logging.error(f"[ALIST] 处理删除事件时出错: {relative_path}, 错误: {e}")
 
-    async def handle_moved(self, event, retry=False):
+    async def handle_moved(self, event):
         relative_src_path = self.get_relative_path(event.src_path)
         relative_dst_path = self.get_relative_path(event.dest_path)
 
         if relative_src_path in ('', '.') or relative_dst_path in ('', '.'):
             logging.warning(f"[ALIST] 跳过相对路径为 '.' 或空字符串的移动事件: {event.src_path} -> {event.dest_path}")
             return
-        src_ext = os.path.splitext(relative_src_path)[1].lower()
 
-        if src_ext == ".mp" and self.is_subtitle_file(relative_dst_path):
+        if self.should_ignore_file_creation_deletion(relative_src_path) and self.is_subtitle_file(relative_dst_path):
             await self.copy_subtitle_file(relative_dst_path)
             self.existing_paths.discard(relative_src_path)
             self.existing_paths.add(relative_dst_path)
-            logging.debug(f"[ALIST] 更新 existing_paths: {relative_src_path} -> {relative_dst_path}")
+            logging.debug("[ALIST] 更新 existing_paths: %s -> %s", relative_src_path, relative_dst_path)
             return
 
         src_in_existing = relative_src_path in self.existing_paths
@@ -300,7 +522,7 @@ class AListSyncHandler(FileSystemEventHandler):
                         else:
                             logging.error(f"[ALIST] 文件移动删除失败: {remote_src_path}")
                 self.existing_paths.discard(relative_src_path)
-                logging.debug(f"[ALIST] 从 existing_paths 中移除源路径: {relative_src_path}")
+                logging.debug("[ALIST] 从 existing_paths 中移除源路径: %s", relative_src_path)
 
             if not src_in_existing and dst_in_existing:
                 remote_src_path = self.get_remote_source_path(relative_dst_path)
@@ -311,7 +533,7 @@ class AListSyncHandler(FileSystemEventHandler):
                 else:
                     logging.error(f"[ALIST] 重命名失败: {remote_src_path} -> {remote_dst_path}")
                 self.existing_paths.add(relative_dst_path)
-                logging.debug(f"[ALIST] 添加到 existing_paths: {relative_dst_path}")
+                logging.debug("[ALIST] 添加到 existing_paths: %s", relative_dst_path)
 
             if src_in_existing and dst_in_existing:
                 remote_src_path = self.get_remote_destination_path(relative_src_path)
@@ -323,70 +545,122 @@ class AListSyncHandler(FileSystemEventHandler):
                     logging.error(f"[ALIST] 重命名失败: {remote_src_path} -> {remote_dst_path}")
                 self.existing_paths.discard(relative_src_path)
                 self.existing_paths.add(relative_dst_path)
-                logging.debug(f"[ALIST] 更新 existing_paths: {relative_src_path} -> {relative_dst_path}")
+                logging.debug("[ALIST] 更新 existing_paths: %s -> %s", relative_src_path, relative_dst_path)
         except Exception as e:
-            if not retry and 'token is expired' in str(e).lower():
-                logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试移动操作。")
-                await self.alist.login(self.user)
-                await self.handle_moved(event, retry=True)
-            else:
-                logging.error(f"[ALIST] 处理移动事件时出错: {event.src_path} -> {event.dest_path}, 错误: {e}")
+            logging.error(f"[ALIST] 处理移动事件时出错: {event.src_path} -> {event.dest_path}, 错误: {e}")
+
+    def enqueue_event(self, event):
+        """
+        在 watchdog 线程中暂存事件，同一事件重复出现时只保留最新一次。
+        同一路径的创建与修改事件合并为一条：创建事件本身不做处理，只要窗口内出现过修改事件就保留修改事件。
+        每个防抖窗口只跨线程提交一次整批事件到事件循环。
+        """
+        if event.event_type in ('created', 'modified'):
+            key = ('created_or_modified', event.src_path, None)
+        else:
+            key = (event.event_type, event.src_path, getattr(event, 'dest_path', None))
+        with self._pending_lock:
+            previous = self._pending.pop(key, None)
+            if previous is not None and previous.event_type == 'modified' and event.event_type == 'created':
+                event = previous
+            self._pending[key] = event
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.debounce_delay, self.flush_pending_events)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush_pending_events(self):
+        """
+        取出当前窗口内暂存的所有事件，并一次性放入事件循环中的事件队列
+        """
+        with self._pending_lock:
+            events = list(self._pending.values())
+            self._pending = {}
+            self._flush_timer = None
+        if events:
+            logging.debug("[ALIST] 提交 %s 个合并后的事件", len(events))
+            self.loop.call_soon_threadsafe(self.event_queue.put_nowait, (self, events))
+
+    async def dispatch_batch(self, events):
+        """
+        并发处理一批事件，各事件之间互不阻塞
+        """
+        handlers = {
+            'created': self.handle_created_or_modified,
+            'modified': self.handle_created_or_modified,
+            'deleted': self.handle_deleted,
+            'moved': self.handle_moved,
+        }
+        results = await asyncio.gather(*(handlers[event.event_type](event) for event in events), return_exceptions=True)
+        for event, result in zip(events, results):
+            if isinstance(result, Exception):
+                logging.error(f"[ALIST] 处理{event.event_type}事件时出错: {event.src_path}, 错误: {result}", exc_info=result)
 
     def on_created(self, event):
-        file_path = event.src_path
-        coro = functools.partial(self.handle_created_or_modified, event)
-        asyncio.run_coroutine_threadsafe(coro(), self.loop)
-        logging.debug(f"[ALIST] 接收到创建事件: {file_path}")
+        self.enqueue_event(event)
+        logging.debug("[ALIST] 接收到创建事件: %s", event.src_path)
 
     def on_modified(self, event):
-        file_path = event.src_path
-        coro = functools.partial(self.handle_created_or_modified, event)
-        asyncio.run_coroutine_threadsafe(coro(), self.loop)
-        logging.debug(f"[ALIST] 接收到修改事件: {file_path}")
+        self.enqueue_event(event)
+        logging.debug("[ALIST] 接收到修改事件: %s", event.src_path)
 
     def on_deleted(self, event):
-        file_path = event.src_path
-        coro = functools.partial(self.handle_deleted, event)
-        asyncio.run_coroutine_threadsafe(coro(), self.loop)
-        logging.debug(f"[ALIST] 接收到删除事件: {file_path}")
+        self.enqueue_event(event)
+        logging.debug("[ALIST] 接收到删除事件: %s", event.src_path)
 
     def on_moved(self, event):
-        file_path = event.src_path
-        coro = functools.partial(self.handle_moved, event)
-        asyncio.run_coroutine_threadsafe(coro(), self.loop)
-        logging.debug(f"[ALIST] 接收到移动事件: {file_path} -> {event.dest_path}")
+        self.enqueue_event(event)
+        logging.debug("[ALIST] 接收到移动事件: %s -> %s", event.src_path, event.dest_path)
 
-    async def copy_file(self, remote_source_path, remote_destination_path, retry=False):
-        source_dir = os.path.dirname(remote_source_path)
+    def on_closed(self, event):
+        # 仅 Linux (inotify) 会产生写入后关闭事件，其他平台继续使用轮询检查
+        if event.is_directory or self.should_ignore_file_creation_deletion(event.src_path):
+            return
+        self.loop.call_soon_threadsafe(self.mark_file_closed, event.src_path)
+        logging.debug("[ALIST] 接收到写入关闭事件: %s", event.src_path)
+
+    async def copy_file(self, remote_source_path, remote_destination_path):
+        source_dir = _remote_dirname(remote_source_path)
         try:
-            async for _ in self.alist.list_dir(source_dir, refresh=True):
-                pass
+            await self.refresh_source_dir(source_dir)
         except Exception as e:
-            if not retry and 'token is expired' in str(e).lower():
-                logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试刷新源路径目录。")
-                await self.alist.login(self.user)
-                await self.copy_file(remote_source_path, remote_destination_path, retry=True)
-                return
             logging.error(f"[ALIST] 刷新 AList 中的源路径目录失败: {source_dir}, 错误: {e}")
             return
 
         # 执行复制操作
         try:
-            destination_dir = os.path.dirname(remote_destination_path)
+            destination_dir = _remote_dirname(remote_destination_path)
             success = await self.alist.copy(remote_source_path, destination_dir)
             if success:
                 logging.info(f"[ALIST] 文件复制成功: {remote_source_path} -> {remote_destination_path}")
             else:
                 logging.error(f"[ALIST] 文件复制失败: {remote_source_path} -> {remote_destination_path}")
         except Exception as e:
-            if not retry and 'token is expired' in str(e).lower():
-                logging.warning(f"[ALIST] Token 过期，尝试重新登录并重试复制文件操作。")
-                await self.alist.login(self.user)
-                await self.copy_file(remote_source_path, remote_destination_path, retry=True)
-                return
             logging.error(f"[ALIST] 执行复制操作时出错: {remote_source_path} -> {remote_destination_path}, 错误: {e}")
 
 
+    async def refresh_source_dir(self, source_dir):
+        """
+        刷新 AList 中的源目录，确保 AList 检测到新增的文件。
+        同一目录尚未发出的刷新会被合并，所有调用方共享同一次 list_dir(refresh=True) 请求。
+        刷新会延迟一个防抖周期再发出，陆续完成写入的同目录文件也能合并到同一次刷新中。
+        """
+        task = self._pending_refreshes.get(source_dir)
+        if task is None:
+            task = self.loop.create_task(self._refresh_source_dir(source_dir))
+            self._pending_refreshes[source_dir] = task
+        await asyncio.shield(task)
+
+    async def _refresh_source_dir(self, source_dir):
+        # 等待一个防抖周期，使这段时间内到达的其他调用方加入本次刷新
+        await asyncio.sleep(self.debounce_delay)
+        # 请求发出后再到达的调用方需要新的刷新，才能看到之后新增的文件
+        self._pending_refreshes.pop(source_dir, None)
+        # 只需要刷新的副作用：刷新在服务端对整个目录生效，per_page=1 让响应只携带一项，
+        # 避免为每次刷新解析、包装整页条目
+        async for _ in self.alist.list_dir(source_dir, per_page=1, refresh=True):
+            pass
+
 class SyncToAlist:
     def __init__(self, alist_config, sync_config):
         self.endpoint = alist_config.get('endpoint')
@@ -396,17 +670,22 @@ class SyncToAlist:
         self.remote_base_directories = alist_config.get('remote_base_directories', [])
         self.local_directories = alist_config.get('local_directories', [])
         self.sync_delete = alist_config.get('sync_delete', False)
+        self.max_concurrency = alist_config.get('max_concurrency', 8)  # 同时进行的 AList 请求数上限
 
         self.debounce_delay = sync_config.get('debounce_delay', 1.0)
         self.file_stable_time = sync_config.get('file_stable_time', 5.0)
+        self.observer_type = sync_config.get('observer_type', 'auto')  # 监控方式: auto / native / polling
+        self.poll_interval = sync_config.get('poll_interval', 30)  # 轮询监控的扫描间隔（秒）
 
         self.subtitle_extensions = set(
             alist_config.get('subtitle_extensions', {'.srt', '.ass', '.sub', '.vtt'}))  # 新增：从配置中获取字幕扩展名，设置默认值
 
-        self.alist = AList(endpoint=self.endpoint)
+        self.alist = PooledAList(endpoint=self.endpoint, max_concurrency=self.max_concurrency)
         self.user = AListUser(username=self.username, rawpwd=self.password)
         self.loop = asyncio.get_event_loop()
-        self.observers = []
+        self.observers = {}  # 监控方式 -> 共享的监控器
+        self.event_queue = None
+        self._dispatch_tasks = set()  # 正在处理的事件批次任务
 
     async def run(self):
         """运行同步任务"""
@@ -422,44 +701,52 @@ class SyncToAlist:
             logging.error("[ALIST] alist 本地目录、源目录、远程目录数量不匹配，请检查配置。")
             return
 
-        for local_dir, source_dir, remote_dir in zip(self.local_directories, self.source_base_directories,
-                                                     self.remote_base_directories):
-            event_handler = AListSyncHandler(
-                alist=self.alist,
-                user=self.user,  # 新增：传递用户对象
-                remote_base_path=remote_dir,
-                local_base_path=local_dir,
-                loop=self.loop,
-                source_base_directory=source_dir,
-                subtitle_extensions=self.subtitle_extensions,  # 传递字幕扩展名
-                debounce_delay=self.debounce_delay,
-                sync_delete=self.sync_delete,
-                file_stable_time=self.file_stable_time
-            )
-
-            observer = Observer()
-            observer.schedule(event_handler, path=local_dir, recursive=True)
-            observer.start()
-            logging.info(f"[ALIST] 开始监控本地目录: {local_dir}")
-            self.observers.append(observer)
-
-        # 保持运行
+        self.event_queue = asyncio.Queue()
+        # 各映射的目录通常位于不同挂载点，遍历以 I/O 为主，因此同时进行；
+        # 每个映射遍历完成后立即开始监控，不必等待其他（可能大得多的）目录遍历结束
+        await asyncio.gather(*(
+            self.watch_directory(local_dir, source_dir, remote_dir)
+            for local_dir, source_dir, remote_dir in zip(self.local_directories, self.source_base_directories,
+                                                         self.remote_base_directories)
+        ))
+
+        # 保持运行：消费各监控器提交的事件批次，每批在独立任务中并发处理
         try:
             while True:
-                await asyncio.sleep(1)
+                handler, events = await self.event_queue.get()
+                task = asyncio.create_task(handler.dispatch_batch(events))
+                self._dispatch_tasks.add(task)
+                task.add_done_callback(self._dispatch_tasks.discard)
         except asyncio.CancelledError:
             logging.info("[ALIST] 收到取消信号，正在停止所有监控...")
         finally:
-            for observer in self.observers:
-                observer.stop()
-            for observer in self.observers:
-                observer.join()
-            logging.info("[ALIST] 所有监控器已停止。")
+            await self.stop()
+
+    async def watch_directory(self, local_dir, source_dir, remote_dir):
+        """为单个映射创建事件处理器并开始监控"""
+        # 构造时需要遍历整个本地目录记录现有路径，放到线程中执行，避免阻塞事件循环
+        event_handler = await asyncio.to_thread(
+            AListSyncHandler,
+            alist=self.alist,
+            remote_base_path=remote_dir,
+            local_base_path=local_dir,
+            loop=self.loop,
+            event_queue=self.event_queue,
+            source_base_directory=source_dir,
+            subtitle_extensions=self.subtitle_extensions,  # 传递字幕扩展名
+            debounce_delay=self.debounce_delay,
+            sync_delete=self.sync_delete,
+            file_stable_time=self.file_stable_time
+        )
+        schedule_shared(self.observers, event_handler, local_dir, self.observer_type, self.poll_interval,
+                        event_filter=AListSyncHandler.EVENT_FILTER)
+        logging.info(f"[ALIST] 开始监控本地目录: {local_dir}")
 
     async def stop(self):
         """停止所有监控器"""
-        for observer in self.observers:
+        for observer in self.observers.values():
             observer.stop()
-        for observer in self.observers:
+        for observer in self.observers.values():
             observer.join()
+        await self.alist.close()
         logging.info("[ALIST] 所有监控器已停止。")
@@ -1,10 +1,185 @@
+import errno
+import fnmatch
+import heapq
+import itertools
 import os
 import shutil
 import logging
 import re
+import threading
 import time
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.events import (
+    DirCreatedEvent, DirDeletedEvent, DirMovedEvent,
+    FileClosedEvent, FileCreatedEvent, FileDeletedEvent, FileMovedEvent, FileSystemEventHandler,
+)
+from .observer import schedule_shared
+
+
+# 仅 Windows 的路径分隔符需要转换；POSIX 下原样返回，省去每次扫描字符串和分配新对象
+_POSIX = os.sep == "/"
+_TO_POSIX = str.maketrans("\\", "/")
+
+
+def _to_posix(path):
+    """将本地路径转换为使用正斜杠的形式"""
+    return path if _POSIX else path.translate(_TO_POSIX)
+
+
+# 根目录末尾可能带有的路径分隔符
+_SEPS = "/" if _POSIX else "\\/"
+
+
+def _join_posix(base, relative_path):
+    """
+    拼接根目录与以正斜杠分隔的相对路径，结果与 _to_posix(os.path.join(base, relative_path)) 相同。
+    relative_path 总是相对路径，直接拼接字符串即可，省去 os.path.join 的逐段解析
+    """
+    if not base:
+        return _to_posix(relative_path)
+    return _to_posix(base.rstrip(_SEPS) + "/" + relative_path)
+
+
+# copy_file_range 不可用（跨文件系统、内核或文件系统不支持等）时返回的错误码
+_COPY_FILE_RANGE_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.EPERM}
+
+
+def _fast_copy(src, dst):
+    """
+    复制文件内容及元数据。
+    Linux 下优先使用 os.copy_file_range：同一 Btrfs/XFS 卷上可直接共享数据块（reflink），无需逐字节复制；
+    不支持时回退到 shutil.copy2（Linux 下其内部使用 sendfile）。
+    """
+    if hasattr(os, "copy_file_range"):
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            infd, outfd = fsrc.fileno(), fdst.fileno()
+            # 大小为 0 的文件（空文件或 /proc 这类伪文件）交给 copy2 处理
+            remaining = os.fstat(infd).st_size or -1
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(infd, outfd, remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except OSError as e:
+                if e.errno not in _COPY_FILE_RANGE_UNSUPPORTED:
+                    raise
+        if remaining == 0:
+            shutil.copystat(src, dst)
+            return
+    shutil.copy2(src, dst)
+
+
+def _same_size_and_mtime(src, dst):
+    """比较两个文件的大小和修改时间（纳秒），任一文件不存在时返回 False"""
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+# 下载器、编辑器和系统产生的临时文件：*.tmp / *.part / *.crdownload / *.swp、.DS_Store、Office 的 ~$ 锁文件
+_TEMP_FILE_RE = re.compile(r"(?:\.(?:tmp|part|crdownload|swp)|(?:^|[\\/])\.DS_Store)\Z|(?:^|[\\/])~\$[^\\/]*\Z", re.IGNORECASE)
+
+
+def _compile_media_patterns(patterns):
+    """
+    将媒体文件通配符预处理一次：
+    形如 "*.ext" 的模式归入扩展名集合，按扩展名 O(1) 判断；
+    其余模式合并为一个忽略大小写的正则，作为兜底匹配。
+    """
+    extensions = set()
+    other_patterns = []
+    for pattern in patterns:
+        suffix = pattern[1:]
+        if (pattern.startswith("*.") and suffix.count(".") == 1
+                and not any(c in suffix for c in "*?[")):
+            extensions.add(suffix.lower())
+        else:
+            other_patterns.append(pattern)
+    regex = None
+    if other_patterns:
+        regex = re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in other_patterns), re.IGNORECASE)
+    return frozenset(extensions), regex
+
+
+def _walk_fast(base):
+    """
+    迭代遍历 base 目录，依次产出 (相对路径, 是否为目录)，相对路径使用正斜杠。
+    直接复用 DirEntry 缓存的类型信息并在遍历中拼接相对路径，
+    不再像 os.walk 那样额外 stat，也无需 relpath/replace。
+    与 os.walk 一致：不进入指向目录的符号链接。
+    """
+    stack = [(base, "")]
+    while stack:
+        abs_path, rel_prefix = stack.pop()
+        try:
+            with os.scandir(abs_path) as it:
+                for entry in it:
+                    rel = rel_prefix + entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        yield rel, True
+                        stack.append((entry.path, rel + "/"))
+                    elif not entry.is_dir():
+                        yield rel, False
+        except OSError as e:
+            logging.warning(f"[STRM] 无法遍历目录: {abs_path}, 错误: {e}")
+
+
+class _TimerQueue:
+    """
+    由单个后台线程按到期时间依次执行的延迟任务队列，
+    代替为每次文件稳定性复查都创建一个 threading.Timer 线程。
+    """
+
+    def __init__(self):
+        self._heap = []  # (到期时间, 序号, 函数, 参数)
+        self._counter = itertools.count()  # 到期时间相同时按加入顺序执行
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def call_later(self, delay, func, *args):
+        """delay 秒后在后台线程中执行 func(*args)，首次调用时启动后台线程"""
+        with self._cond:
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="strm-timer", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), func, args))
+            self._cond.notify()
+
+    def stop(self):
+        """停止后台线程并丢弃尚未到期的任务"""
+        with self._cond:
+            thread = self._thread
+            self._thread = None
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, func, args = heapq.heappop(self._heap)
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error(f"[STRM] 执行延迟任务时出错: {e}")
 
 
 class SyncToStrm:
@@ -20,54 +195,139 @@ class SyncToStrm:
         self.full_sync_on_startup = config.get('full_sync_on_startup', True)
         self.use_direct_link = config.get('use_direct_link', False)
         self.base_url = config.get('base_url', '')
+        self.observer_type = config.get('observer_type', 'auto')  # 监控方式: auto / native / polling
+        self.poll_interval = config.get('poll_interval', 30)  # 轮询监控的扫描间隔（秒）
+        self.full_sync_workers = config.get('full_sync_workers', min(32, (os.cpu_count() or 1) * 4))  # 全量同步的并发线程数
+        self._media_extensions, self._media_regex = _compile_media_patterns(self.media_file_types)
+        self.io_workers = config.get('io_workers', 4)  # 实时事件中复制文件、生成 .strm 的线程数
+        self._io_pool = None
+        self.timers = _TimerQueue()  # 各 SyncHandler 共用的延迟任务队列
+        self._known_dirs = set()  # 已确认存在的目标目录，避免每个文件都调用 makedirs
+        self._known_dirs_lock = threading.Lock()  # 仅在未命中时加锁，命中时直接读取集合
 
     def log_message(self, message):
         logging.info("[STRM] " + message)
 
     def is_media_file(self, relative_path: str) -> bool:
-        """检查文件是否是媒体文件"""
-        return any(re.fullmatch(pattern.replace("*", ".*"), relative_path) for pattern in self.media_file_types)
+        """检查文件是否是媒体文件（扩展名不区分大小写）"""
+        if os.path.splitext(relative_path)[1].lower() in self._media_extensions:
+            return True
+        return self._media_regex is not None and self._media_regex.match(relative_path) is not None
 
     class SyncHandler(FileSystemEventHandler):
+        # 只处理创建、删除、移动事件，以及作为写入完成信号的关闭事件；修改、打开事件不向 inotify 订阅
+        EVENT_FILTER = [
+            FileCreatedEvent, DirCreatedEvent,
+            FileDeletedEvent, DirDeletedEvent,
+            FileMovedEvent, DirMovedEvent,
+            FileClosedEvent,
+        ]
+
         def __init__(self, source_dir, target_dir, media_prefix, parent):
             super().__init__()
             self.source_dir = source_dir
             self.target_dir = target_dir
             self.media_prefix = media_prefix
+            self.strm_prefix = parent.strm_prefix(media_prefix)
             self.parent = parent
+            self.check_interval = 2  # 文件稳定性检测间隔（秒）
+            self.max_checks = 5  # 文件稳定性最多检测次数
+            self._stability_checks = {}  # 正在检测稳定性的文件路径 -> (上次大小, 已检测次数, 本轮检测的标识)
+            self._stability_lock = threading.Lock()
+            # watchdog 给出的路径以监控时传入的 source_dir 开头，预先计算前缀后直接切片
+            self._source_prefix = source_dir.rstrip("\\/") + os.sep
+            self._source_prefix_len = len(self._source_prefix)
 
         def get_relative_path(self, full_path):
-            return os.path.relpath(full_path, self.source_dir).replace("\\", "/")
+            if full_path.startswith(self._source_prefix):
+                return _to_posix(full_path[self._source_prefix_len:])
+            return _to_posix(os.path.relpath(full_path, self.source_dir))
 
         def is_media_file(self, relative_path):
             """检查文件是否是媒体文件"""
-            return any(
-                re.fullmatch(pattern.replace("*", ".*"), relative_path) for pattern in self.parent.media_file_types)
+            return self.parent.is_media_file(relative_path)
 
-        def is_file_stable(self, file_path, check_interval=2, max_checks=5):
+        def watch_file_stability(self, source_file_path, relative_path):
             """
-            检测文件是否稳定（大小保持不变）。
+            检测文件是否稳定（大小保持不变），稳定后再同步文件。
+            不在 watchdog 线程中阻塞等待，每次复查都由共享的延迟任务队列在 check_interval 秒后触发；
+            期间收到写入后关闭的通知（IN_CLOSE_WRITE）则由 on_closed 提前完成检测。
             """
+            token = object()
+            with self._stability_lock:
+                if source_file_path in self._stability_checks:
+                    return  # 已在检测中
+                self._stability_checks[source_file_path] = (-1, 0, token)
+            self._recheck_file_stability(source_file_path, relative_path, token)
+
+        def _recheck_file_stability(self, source_file_path, relative_path, token):
+            """对比本次与上次的文件大小，未稳定则重新安排复查，超过 max_checks 次仍不稳定则放弃"""
             try:
-                previous_size = -1
-                for _ in range(max_checks):
-                    if not os.path.exists(file_path):
-                        return False  # 文件可能被删除
-                    current_size = os.path.getsize(file_path)
-                    if current_size == previous_size:
-                        return True  # 文件大小稳定
-                    previous_size = current_size
-                    time.sleep(check_interval)  # 等待一段时间后再次检查
-                return False  # 超过检查次数，文件仍不稳定
+                current_size = os.path.getsize(source_file_path)
+            except FileNotFoundError:
+                current_size = None  # 文件可能被删除
             except Exception as e:
-                logging.error(f"检测文件稳定性时出错: {file_path}, 错误: {e}")
-                return False
+                logging.error(f"检测文件稳定性时出错: {source_file_path}, 错误: {e}")
+                current_size = None
+
+            with self._stability_lock:
+                entry = self._stability_checks.get(source_file_path)
+                if entry is None or entry[2] is not token:
+                    return  # 本轮检测已由 on_closed 提前完成
+                previous_size, checks, _ = entry
+                if current_size is not None and current_size != previous_size and checks + 1 < self.max_checks:
+                    self._stability_checks[source_file_path] = (current_size, checks + 1, token)
+                    self.parent.timers.call_later(self.check_interval, self._recheck_file_stability,
+                                                  source_file_path, relative_path, token)
+                    return
+                del self._stability_checks[source_file_path]
+
+            if current_size is None or current_size != previous_size:
+                self.parent.log_message(f"跳过: 文件不稳定或被删除: {source_file_path}")
+            else:
+                self.submit_for_source(source_file_path, relative_path,
+                                       self.parent.sync_file, relative_path, self.source_dir, self.target_dir)
+
+        def submit_for_source(self, source_file_path, relative_path, func, *args):
+            """
+            将由 source_file_path 生成目标文件的任务交给 I/O 线程池。
+            同一路径的删除任务可能早于排队中的写入任务执行，
+            因此写入前确认源文件仍存在，写入后若源文件已被删除则再清理一次目标
+            """
+            self.parent.submit_io(self._write_if_source_exists, source_file_path, relative_path, func, args)
+
+        def submit_for_deletion(self, source_path, func, *args):
+            """
+            将删除目标的任务交给 I/O 线程池，删除大目录时不阻塞共享的事件分发线程。
+            删除可能晚于同一路径随后的创建执行，因此删除前若源路径已被重新创建则跳过
+            """
+            self.parent.submit_io(self._delete_if_source_missing, source_path, func, args)
+
+        def _write_if_source_exists(self, source_file_path, relative_path, func, args):
+            if not os.path.exists(source_file_path):
+                self.parent.log_message(f"跳过: 源文件已被删除: {source_file_path}")
+                return
+            func(*args)
+            if self.parent.enable_cleanup and not os.path.exists(source_file_path):
+                self.parent.delete_target_file(relative_path, self.target_dir)
+
+        def _delete_if_source_missing(self, source_path, func, args):
+            if os.path.exists(source_path):
+                self.parent.log_message(f"跳过删除: 源路径已重新创建: {source_path}")
+                return
+            func(*args)
+
+        def dispatch(self, event):
+            # 临时文件的创建、修改、删除事件在分发前直接丢弃；移动事件保留，由 handle_file_event 判断
+            if event.event_type != 'moved' and not event.is_directory and _TEMP_FILE_RE.search(event.src_path):
+                return
+            super().dispatch(event)
 
         def on_created(self, event):
             relative_path = self.get_relative_path(event.src_path)
 
             if event.src_path.lower().endswith('.mp'):
-                logging.debug(f"忽略 .mp 文件创建事件: {event.src_path}")
+                logging.debug("忽略 .mp 文件创建事件: %s", event.src_path)
                 return
 
             if event.is_directory:
@@ -75,13 +335,26 @@ class SyncToStrm:
             else:
                 self.handle_file_event(event, relative_path)
 
+        def on_closed(self, event):
+            """文件写入后被关闭，若正在等待其稳定，则直接视为写入完成"""
+            source_file_path = event.src_path
+            if source_file_path not in self._stability_checks:
+                return
+            with self._stability_lock:
+                if self._stability_checks.pop(source_file_path, None) is None:
+                    return
+            logging.debug("文件已关闭写入，跳过稳定性等待: %s", source_file_path)
+            relative_path = self.get_relative_path(source_file_path)
+            self.submit_for_source(source_file_path, relative_path,
+                                   self.parent.sync_file, relative_path, self.source_dir, self.target_dir)
+
         def on_modified(self, event):
             """去除文件修改的事件处理逻辑"""
             pass
 
         def on_deleted(self, event):
             relative_path = self.get_relative_path(event.src_path)
-            # 删除操作一般不需要去抖动，可以立即处理
+            # 删除操作一般不需要去抖动，立即提交到 I/O 线程池处理
             if event.is_directory:
                 self.handle_directory_event(event, relative_path)
             else:
@@ -100,54 +373,59 @@ class SyncToStrm:
 
                 # 如果源文件是 .mp 文件且目标文件是有效的媒体文件类型，生成 .strm 文件
                 if event.src_path.lower().endswith('.mp') and self.is_media_file(dest_relative_path):
-                    logging.debug(f"文件重命名: {event.src_path} -> {event.dest_path}")
+                    logging.debug("文件重命名: %s -> %s", event.src_path, event.dest_path)
                     # 生成 .strm 文件
-                    self.parent.create_strm_file(dest_relative_path, self.target_dir, self.media_prefix)
+                    self.submit_for_source(event.dest_path, dest_relative_path, self.parent.create_strm_file,
+                                           dest_relative_path, self.target_dir, self.strm_prefix)
                     return  # 处理完后直接返回，跳过其他同步
 
                 if event.src_path.endswith('.mp'):
                     # 重新同步文件
-                    self.parent.sync_file(self.get_relative_path(event.dest_path), self.source_dir, self.target_dir)
+                    self.submit_for_source(event.dest_path, dest_relative_path, self.parent.sync_file,
+                                           dest_relative_path, self.source_dir, self.target_dir)
                 return
 
-            source_file_path = os.path.join(self.source_dir, relative_path).replace("\\", "/")
+            source_file_path = _join_posix(self.source_dir, relative_path)
 
             if event.event_type == 'created':  # 只处理创建事件
                 if self.is_media_file(relative_path):
-                    # 检测文件是否稳定
-                    if self.is_file_stable(source_file_path):
-                        self.parent.create_strm_file(relative_path, self.target_dir, self.media_prefix)
-                    else:
-                        self.parent.log_message(f"跳过: 文件不稳定或被删除: {source_file_path}")
+                    # .strm 内容只取决于路径，不读取源文件，无需等待写入完成
+                    self.submit_for_source(source_file_path, relative_path, self.parent.create_strm_file,
+                                           relative_path, self.target_dir, self.strm_prefix)
                 else:
-                    # 检测文件是否稳定
-                    if self.is_file_stable(source_file_path):
-                        self.parent.sync_file(relative_path, self.source_dir, self.target_dir)
-                    else:
-                        self.parent.log_message(f"跳过: 文件不稳定或被删除: {source_file_path}")
+                    # 非媒体文件需要复制内容，检测文件稳定后再同步
+                    self.watch_file_stability(source_file_path, relative_path)
             elif event.event_type == 'deleted' and self.parent.enable_cleanup:
-                self.parent.delete_target_file(relative_path, self.target_dir)
+                self.submit_for_deletion(source_file_path, self.parent.delete_target_file,
+                                         relative_path, self.target_dir)
 
         def handle_directory_event(self, event, relative_path):
             """处理目录的创建或删除"""
-            target_dir_path = os.path.join(self.target_dir, relative_path).replace("\\", "/")
+            target_dir_path = _join_posix(self.target_dir, relative_path)
             if event.event_type == 'deleted' and self.parent.enable_cleanup:
-                if os.path.exists(target_dir_path):
-                    try:
-                        shutil.rmtree(target_dir_path)
-                        self.parent.log_message(f"成功删除目标目录: {target_dir_path}")
-                    except Exception as e:
-                        self.parent.log_message(f"错误: 无法删除目标目录: {target_dir_path}, {e}")
+                self.submit_for_deletion(event.src_path, self.remove_target_dir, target_dir_path)
             elif event.event_type == 'created':
                 if not os.path.exists(target_dir_path):
                     try:
                         os.makedirs(target_dir_path, exist_ok=True)
+                        self.parent.remember_target_dir(target_dir_path)
                         self.parent.log_message(f"成功创建目标目录: {target_dir_path}")
                     except Exception as e:
                         self.parent.log_message(f"错误: 无法创建目标目录: {target_dir_path}, {e}")
 
+        def remove_target_dir(self, target_dir_path):
+            """删除源目录对应的整个目标目录"""
+            if os.path.exists(target_dir_path):
+                try:
+                    shutil.rmtree(target_dir_path)
+                    self.parent.forget_target_dir(target_dir_path)
+                    self.parent.log_message(f"成功删除目标目录: {target_dir_path}")
+                except Exception as e:
+                    self.parent.log_message(f"错误: 无法删除目标目录: {target_dir_path}, {e}")
+
     def start(self):
-        self.observers = []
+        self.observers = {}  # 监控方式 -> 共享的监控器
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="strm-io")
         for mapping in self.sync_directories:
             source_dir = mapping.get('source_dir')
             target_dir = mapping.get('target_dir')
@@ -160,81 +438,198 @@ class SyncToStrm:
             self.log_message(f"开始监控目录: {source_dir} -> {target_dir} (media 前缀: {media_prefix})")
 
             event_handler = self.SyncHandler(source_dir, target_dir, media_prefix, self)
+            strm_prefix = event_handler.strm_prefix
 
             # 执行初始全量同步
             if self.full_sync_on_startup:
                 self.log_message(f"执行初始全量同步: {source_dir} -> {target_dir}")
-                for root, dirs, files in os.walk(source_dir):
-                    relative_root = os.path.relpath(root, source_dir).replace("\\", "/")
-                    if relative_root == ".":
-                        relative_root = ""
-                    target_root = os.path.join(target_dir, relative_root).replace("\\", "/")
-                    if not os.path.exists(target_root):
-                        try:
-                            os.makedirs(target_root, exist_ok=True)
-                            self.log_message(f"创建目录: {target_root}")
-                        except Exception as e:
-                            self.log_message(f"错误: 无法创建目录: {target_root}, {e}")
-
-                    for file in files:
-                        relative_path = os.path.join(relative_root, file).replace("\\", "/")
+                self.ensure_target_dir(target_dir)
+                # 目录在遍历线程中按先父后子的顺序创建，每个文件作为一个任务交给线程池并发处理；
+                # 同时排队的任务数有上限，遍历大型媒体库时不会积压大量任务，任务完成时即记录错误
+                in_flight = threading.Semaphore(self.full_sync_workers * 2)
+
+                def on_done(future):
+                    in_flight.release()
+                    if future.exception() is not None:
+                        self.log_message(f"错误: 全量同步文件时出错: {future.exception()}")
+
+                with ThreadPoolExecutor(max_workers=self.full_sync_workers) as executor:
+                    for relative_path, is_dir in _walk_fast(source_dir):
+                        if is_dir:
+                            self.ensure_target_dir(_join_posix(target_dir, relative_path))
+                            continue
+                        if _TEMP_FILE_RE.search(relative_path):
+                            # 与实时监控一致，跳过下载/编辑中的临时文件，它们的删除事件也不会被处理
+                            continue
+                        in_flight.acquire()
                         # 使用is_media_file判断文件类型
                         if self.is_media_file(relative_path):
-                            self.create_strm_file(relative_path, target_dir, media_prefix)
+                            future = executor.submit(self.create_strm_file, relative_path, target_dir, strm_prefix)
                         else:
-                            self.sync_file(relative_path, source_dir, target_dir)
+                            future = executor.submit(self.sync_file, relative_path, source_dir, target_dir)
+                        future.add_done_callback(on_done)
 
-            observer = Observer()
-            observer.schedule(event_handler, path=source_dir, recursive=True)
-            observer.start()
-            self.observers.append(observer)
+            schedule_shared(self.observers, event_handler, source_dir, self.observer_type, self.poll_interval,
+                            event_filter=self.SyncHandler.EVENT_FILTER)
 
         self.full_sync_on_startup = False
         self.log_message("所有监控器已启动。")
 
     def stop(self):
         """停止所有监控器"""
-        for observer in self.observers:
+        for observer in self.observers.values():
             observer.stop()
-        for observer in self.observers:
+        for observer in self.observers.values():
             observer.join()
+        self.timers.stop()
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True)
         self.log_message("所有监控器已停止。")
 
-    def create_strm_file(self, relative_path, target_dir, media_prefix):
-        target_strm_file = os.path.join(target_dir, os.path.splitext(relative_path)[0] + ".strm").replace("\\", "/")
-        if os.path.exists(target_strm_file) and not self.overwrite_existing:
-            self.log_message(f"跳过: .strm 文件已存在: {target_strm_file}")
+    def submit_io(self, func, *args):
+        """
+        将实时事件触发的文件复制、.strm 生成和目标删除交给 I/O 线程池执行，
+        避免大文件复制、大目录删除阻塞监控器的事件分发线程和延迟任务线程。
+        """
+        self._io_pool.submit(func, *args).add_done_callback(self._log_io_error)
+
+    def _log_io_error(self, future):
+        if future.exception() is not None:
+            self.log_message(f"错误: 处理文件时出错: {future.exception()}")
+
+    def ensure_target_dir(self, target_root):
+        """
+        全量同步时确保目标目录存在。
+        遍历时父目录总是先于子目录处理，直接 mkdir 一次即可区分新建与已存在，无需先 exists 再 makedirs
+        """
+        if target_root in self._known_dirs:
             return
-
-        strm_content = f"{self.base_url}{media_prefix}/{relative_path}" if self.use_direct_link else f"{media_prefix}/{relative_path}"
+        try:
+            try:
+                os.mkdir(target_root)
+            except FileNotFoundError:
+                # 上级目录也不存在（例如首次同步时的目标根目录），逐级创建
+                os.makedirs(target_root, exist_ok=True)
+            self.log_message(f"创建目录: {target_root}")
+        except FileExistsError:
+            pass
+        except Exception as e:
+            self.log_message(f"错误: 无法创建目录: {target_root}, {e}")
+            return
+        self.remember_target_dir(target_root)
+
+    def ensure_parent_dir(self, file_path):
+        """
+        确保文件所在的目标目录存在，已确认过的目录不再重复 makedirs。
+        多个线程同时写入同一新目录时，只有第一个线程调用 makedirs
+        """
+        parent = os.path.dirname(file_path)
+        if parent in self._known_dirs:
+            return
+        with self._known_dirs_lock:
+            if parent not in self._known_dirs:
+                os.makedirs(parent, exist_ok=True)
+                self._known_dirs.add(parent)
+
+    def write_into_target_dir(self, file_path, write):
+        """
+        确保目标目录存在后调用 write() 写入 file_path。
+        已确认的目录可能在进程外被删除（用户手动删除、清理脚本等），此时缓存已失效：
+        将该目录移出已确认集合，重新创建后再重试一次
+        """
+        self.ensure_parent_dir(file_path)
+        try:
+            return write()
+        except FileNotFoundError:
+            if os.path.isdir(os.path.dirname(file_path)):
+                raise  # 目标目录仍在，缺失的是源文件
+            self.rebuild_parent_dir(file_path)
+            return write()
+
+    def rebuild_parent_dir(self, file_path):
+        """
+        目标目录已不存在：清除其缓存记录并重新创建。
+        清除与重建在同一把锁内完成，多个线程同时发现时只有第一个线程重建，
+        也不会与 remember_target_dir / forget_target_dir 交错
+        """
+        parent = os.path.dirname(file_path)
+        prefix = parent.rstrip("/") + "/"
+        with self._known_dirs_lock:
+            if os.path.isdir(parent):
+                self._known_dirs.add(parent)  # 已由其他线程重建
+                return
+            self.log_message(f"目标目录已被外部删除，重新创建: {parent}")
+            self._known_dirs = {d for d in self._known_dirs if d != parent and not d.startswith(prefix)}
+            os.makedirs(parent, exist_ok=True)
+            self._known_dirs.add(parent)
+
+    def remember_target_dir(self, dir_path):
+        """记录已确认存在的目标目录"""
+        with self._known_dirs_lock:
+            self._known_dirs.add(dir_path)
+
+    def forget_target_dir(self, dir_path):
+        """目标目录被删除后，将其及所有子目录移出已确认集合"""
+        prefix = dir_path.rstrip("/") + "/"
+        with self._known_dirs_lock:
+            self._known_dirs = {d for d in self._known_dirs if d != dir_path and not d.startswith(prefix)}
+
+    def strm_prefix(self, media_prefix):
+        """.strm 内容中相对路径之前的固定部分，每个映射只计算一次"""
+        return f"{self.base_url}{media_prefix}/" if self.use_direct_link else f"{media_prefix}/"
+
+    def create_strm_file(self, relative_path, target_dir, strm_prefix):
+        """strm_prefix: 由 strm_prefix() 预先生成的内容前缀"""
+        target_strm_file = _join_posix(target_dir, os.path.splitext(relative_path)[0] + ".strm")
+
+        strm_bytes = (strm_prefix + relative_path).encode('utf-8')
+
+        if self.overwrite_existing:
+            # 内容相同则不重写，避免媒体服务器因文件修改而重新扫描
+            try:
+                with open(target_strm_file, "rb") as f:
+                    if f.read() == strm_bytes:
+                        self.log_message(f"跳过: .strm 文件内容未变化: {target_strm_file}")
+                        return
+            except OSError:
+                pass
+
+        def write():
+            # 内容只有一行，直接以二进制无缓冲方式写入，跳过文本编码层；
+            # 不覆盖时以独占方式创建，文件已存在由 open 直接报告，无需事先 exists 检查
+            with open(target_strm_file, "wb" if self.overwrite_existing else "xb", buffering=0) as f:
+                f.write(strm_bytes)
 
         try:
-            os.makedirs(os.path.dirname(target_strm_file), exist_ok=True)
-            with open(target_strm_file, "w", encoding='utf-8') as f:
-                f.write(strm_content)
+            self.write_into_target_dir(target_strm_file, write)
             self.log_message(f"成功生成 .strm 文件: {target_strm_file}")
+        except FileExistsError:
+            self.log_message(f"跳过: .strm 文件已存在: {target_strm_file}")
         except Exception as e:
             self.log_message(f"错误: 无法生成 .strm 文件: {target_strm_file}, {e}")
 
     def sync_file(self, relative_path, source_dir, target_dir):
-        source_file_path = os.path.join(source_dir, relative_path).replace("\\", "/")
-        target_file_path = os.path.join(target_dir, relative_path).replace("\\", "/")
-
-        os.makedirs(os.path.dirname(target_file_path), exist_ok=True)
+        source_file_path = _join_posix(source_dir, relative_path)
+        target_file_path = _join_posix(target_dir, relative_path)
 
         if not self.overwrite_existing and os.path.exists(target_file_path):
             self.log_message(f"跳过: 非媒体文件已存在: {target_file_path}")
             return
 
+        if self.overwrite_existing and _same_size_and_mtime(source_file_path, target_file_path):
+            # 复制时会保留修改时间，大小和修改时间都一致说明源文件自上次同步后未变化
+            self.log_message(f"跳过: 非媒体文件未变化: {target_file_path}")
+            return
+
         try:
-            shutil.copy2(source_file_path, target_file_path)
+            self.write_into_target_dir(target_file_path, lambda: _fast_copy(source_file_path, target_file_path))
             self.log_message(f"成功同步非媒体文件: {source_file_path} -> {target_file_path}")
         except Exception as e:
             self.log_message(f"错误: 无法同步非媒体文件: {source_file_path} -> {target_file_path}, {e}")
 
     def delete_target_file(self, relative_path, target_dir):
         """删除目标文件及其关联的 .strm 文件"""
-        target_file_path = os.path.join(target_dir, relative_path).replace("\\", "/")
+        target_file_path = _join_posix(target_dir, relative_path)
 
         # 如果目标是一个文件，首先删除它
         if os.path.exists(target_file_path):
@@ -242,6 +637,7 @@ class SyncToStrm:
                 # 如果是文件夹，使用 rmtree 删除文件夹
                 if os.path.isdir(target_file_path):
                     shutil.rmtree(target_file_path)
+                    self.forget_target_dir(target_file_path)
                     self.log_message(f"成功删除目标目录: {target_file_path}")
                 else:
                     os.remove(target_file_path)
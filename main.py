@@ -1,11 +1,20 @@
 import asyncio
+import atexit
 import logging
 import os
+import queue
+import signal
+import sys
 import yaml
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from Scripts.sync_to_strm import SyncToStrm
 from Scripts.sync_to_alist import SyncToAlist
 
+try:
+    import uvloop  # 可选依赖：安装后使用基于 libuv 的事件循环
+except ImportError:
+    uvloop = None
+
 def setup_logging(log_file: str):
     """配置统一的日志系统"""
     log_dir = os.path.dirname(log_file)
@@ -18,21 +27,38 @@ def setup_logging(log_file: str):
     file_handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8')
     file_formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y/%m/%d %H:%M:%S')
     file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
 
     # 控制台日志
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_formatter = logging.Formatter('%(message)s')
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+
+    # 各线程只把日志记录放入队列，格式化和写文件/控制台交给后台监听线程完成
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # 退出时写完队列中剩余的日志
 
 def load_config(config_path: str):
     """加载配置文件"""
     with open(config_path, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
 
+def log_task_exception(task: asyncio.Task):
+    """任务异常结束时立即记录错误，避免异常留在任务中直到退出时才被丢弃"""
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logging.error(f"[MAIN] 任务 {task.get_name()} 异常退出: {exc!r}", exc_info=exc)
+
 async def main():
+    # Python 3.12+ 启用急切任务：协程在 create_task 时立即执行到第一次挂起，提前返回的任务无需经过调度
+    if sys.version_info >= (3, 12):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     # 加载配置
     config_path = os.getenv('CONFIG_PATH', '/config/config.yaml')
     config = load_config(config_path)
@@ -50,17 +76,30 @@ async def main():
     # 初始化并启动 sync_to_alist
     alist_config = config.get('alist', {})
     sync_to_alist = SyncToAlist(alist_config, sync_config)
-    asyncio.create_task(sync_to_alist.run())
+    alist_task = asyncio.create_task(sync_to_alist.run(), name="sync_to_alist")
+    alist_task.add_done_callback(log_task_exception)
 
-    # 保持主线程运行
+    # 保持运行，直到收到 SIGINT/SIGTERM；等待期间事件循环不再被定时唤醒
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows 不支持，Ctrl+C 时主任务会被直接取消
     try:
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
+        await stop_event.wait()
+    finally:
         logging.info("[MAIN] 收到退出信号，正在停止所有任务...")
         sync_to_strm.stop()
-        await sync_to_alist.stop()
+        # run() 在取消时会停止 AList 监控器并关闭连接
+        alist_task.cancel()
+        await asyncio.gather(alist_task, return_exceptions=True)
         logging.info("[MAIN] 所有任务已停止。")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # uvloop.run 自 0.18 起提供，更早的版本仍使用默认事件循环
+    if uvloop is not None and hasattr(uvloop, "run"):
+        uvloop.run(main())
+    else:
+        asyncio.run(main())